@@ -1,4 +1,7 @@
-from kucoin.client import Trade
+from kucoin.client import Trade, WsToken
+from kucoin.websocket.websocket import ConnectWebsocket
+import asyncio
+import functools
 import time
 import random
 
@@ -15,6 +18,12 @@ def init_client(api_key, api_secret, api_passphrase):
         print(f"❌ Eroare la inițializarea clientului KuCoin: {e}")
         raise
 
+
+@functools.lru_cache(maxsize=32)
+def get_client(api_key, api_secret, api_passphrase):
+    """Returnează clientul KuCoin din cache (unul per set de chei API)."""
+    return init_client(api_key, api_secret, api_passphrase)
+
 # =====================================================
 # 🧱 Funcție generală de retry (stabilitate 24/7)
 # =====================================================
@@ -90,3 +99,118 @@ def place_limit_sell(client, symbol, amount, price, strategy_label="BTS"):
     else:
         print(f"[{symbol}][{strategy_label}] ❌ Limit SELL failed after retries.")
     return order_id
+
+# =====================================================
+# 📡 Stream privat de ordine (WebSocket)
+# =====================================================
+USER_ORDERS_TOPIC = "/spotMarket/tradeOrders"
+
+
+class _FetchedToken:
+    """Răspuns get_ws_token deja obținut, servit lui ConnectWebsocket._run fără REST."""
+
+    def __init__(self, details):
+        self._details = details
+
+    def get_ws_token(self, is_private=False):
+        return self._details
+
+
+class _UserStreamSocket(ConnectWebsocket):
+    """ConnectWebsocket cu stare de conexiune și close() (biblioteca nu le expune)."""
+
+    def __init__(self, loop, client, callback, on_status=None):
+        self._tasks = set()
+        self._run_task = None
+        self._on_status = on_status
+        self._token_client = client
+        super().__init__(loop, client, callback, private=True)
+        # Biblioteca re-trimite subscribe pentru topics la fiecare (re)conectare
+        self.topics.append(USER_ORDERS_TOPIC)
+
+    def _track(self):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _set_status(self, connected):
+        if self._on_status:
+            self._on_status(connected)
+
+    async def run_forever(self):
+        self._track()
+        await super().run_forever()
+
+    async def _run(self, event):
+        self._track()
+        self._run_task = asyncio.current_task()
+        try:
+            # get_ws_token e un apel requests blocant; în biblioteca originală rulează pe
+            # event loop și ar bloca toți botii la fiecare (re)conectare
+            details = await asyncio.to_thread(self._token_client.get_ws_token, self._private)
+            self._client = _FetchedToken(details)
+            await super()._run(event)
+        finally:
+            self._set_status(False)
+
+    async def _recover_topic_req_msg(self, event):
+        self._track()
+        await super()._recover_topic_req_msg(event)
+        self._set_status(True)
+
+    async def close(self):
+        self._set_status(False)
+        socket_open = self._socket is not None and self._socket.open
+        tasks = list(self._tasks)
+        for task in tasks:
+            # _run înghite CancelledError în recv(); cu socket deschis îl oprește închiderea lui
+            if not (task is self._run_task and socket_open):
+                task.cancel()
+        if socket_open:
+            await self._socket.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def open_user_stream(api_key, api_secret, api_passphrase, on_status=None):
+    """
+    Generator async cu ordinele complet executate ale contului (canal /spotMarket/tradeOrders).
+    on_status(True/False) e apelat când abonamentul devine activ / conexiunea cade.
+    """
+    queue = asyncio.Queue()
+
+    async def on_message(msg):
+        if msg.get("topic") == USER_ORDERS_TOPIC:
+            await queue.put(msg.get("data") or {})
+
+    token = WsToken(key=api_key, secret=api_secret, passphrase=api_passphrase)
+    conn = _UserStreamSocket(asyncio.get_running_loop(), token, on_message, on_status)
+    print("✅ KuCoin user stream started.")
+
+    matches = {}  # order_id → [funds, size], din evenimentele "match"
+    try:
+        while True:
+            data = await queue.get()
+            order_id = data.get("orderId")
+            kind = data.get("type")
+            if not order_id:
+                continue
+
+            if kind == "match":
+                price = float(data.get("matchPrice") or 0)
+                size = float(data.get("matchSize") or 0)
+                acc = matches.setdefault(order_id, [0.0, 0.0])
+                acc[0] += price * size
+                acc[1] += size
+            elif kind == "filled":
+                funds, size = matches.pop(order_id, (0.0, 0.0))
+                yield {
+                    "order_id": order_id,
+                    "side": data.get("side", ""),
+                    "status": "done",
+                    "avg_price": (funds / size) if size > 0 else 0,
+                    "filled_size": float(data.get("filledSize") or size),
+                }
+            elif kind == "canceled":
+                matches.pop(order_id, None)
+    finally:
+        await conn.close()
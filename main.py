@@ -1,50 +1,64 @@
-import time
-import threading
+import asyncio
 import uuid
 import os
 import logging
-from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
 from exchange import (
-    init_client,
+    get_client,
     market_buy,
     check_order_executed,
     place_limit_sell,
+    open_user_stream,
 )
 from supabase_client import (
     get_latest_settings,
     save_order,
     supabase,
     update_execution_time_and_profit,
+    utcnow_iso,
 )
 
 # =====================================================
 # 🪵 Setup logging
 # =====================================================
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    filename="logs/bts.log",
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-)
-console = logging.StreamHandler()
-console.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
-console.setFormatter(formatter)
-logging.getLogger("").addHandler(console)
+def setup_logging():
+    """Configurează fișierul + consola o singură dată (fără handler-e duplicate)."""
+    root = logging.getLogger("")
+    if root.handlers:
+        return
 
-logging.info("🚀 BTS BOT (Buy-Then-Sell) started...\n")
+    os.makedirs("logs", exist_ok=True)
+    logging.basicConfig(
+        filename="logs/bts.log",
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
+    console = logging.StreamHandler()
+    console.setLevel(logging.INFO)
+    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    console.setFormatter(formatter)
+    root.addHandler(console)
 
 # =====================================================
 # ⚙️ Constante
 # =====================================================
 MARKET_TIMEOUT_SECONDS = 600  # 10 minute max pentru execuție MARKET
 TICK_SIZE = 0.00001  # pentru HONEY-USDT
+_INV_TICK = round(1 / TICK_SIZE)  # 100_000 ticks per unitate
+
+FAST_FILL_SECONDS = 1  # fill mai rapid de atât → BUY salvat direct ca executed
+MAX_UNCLAIMED_FILLS = 256  # fill-uri păstrate pentru ordine încă neașteptate
+POLL_INITIAL_DELAY = 0.1  # primul poll MARKET după 100ms, apoi dublat până la check_delay
+STARTUP_SPREAD_SECONDS = 60  # intervalul maxim în care pornesc toți botii
+CHECKER_MAX_WORKERS = 16  # thread-uri dedicate checker-ului (REST KuCoin + Supabase)
 
 # =====================================================
 # 🧮 Tick Size Adjust
 # =====================================================
-def adjust_price_to_tick(price, tick_size=TICK_SIZE):
-    return round(round(price / tick_size) * tick_size, 5)
+def adjust_price_to_tick(price):
+    # Un singur round (half-to-even, ca înainte); n / 100000 e deja float-ul cel mai apropiat
+    return round(price / TICK_SIZE) / _INV_TICK
 
 # =====================================================
 # 💾 Save wrapper
@@ -59,51 +73,126 @@ def safe_save_order(symbol, side, price, status, meta):
         logging.error(f"[{symbol}] ❌ save_order failed: {e}")
 
 # =====================================================
-# ⏱️ Așteaptă execuția MARKET cu timeout
+# 📡 Evenimente de execuție (un Event per order_id)
 # =====================================================
-def wait_market_execution(client, symbol, order_id, amount, check_delay, cycle_id):
-    start_ts = time.time()
+_fill_events = {}
+_fill_prices = {}
+_unclaimed_fills = {}  # order_id → avg_price, din WS, pentru ordine încă neașteptate
+_user_streams = {}  # api_key → task-ul listener-ului WS
+_streams_connected = set()  # api_key-uri cu abonamentul WS activ acum
+
+
+def _fill_event(order_id):
+    event = _fill_events.get(order_id)
+    if event is None:
+        event = _fill_events[order_id] = asyncio.Event()
+    return event
+
+
+def notify_fill(order_id, avg_price):
+    """Marchează ordinul ca executat și trezește coroutina care îl așteaptă."""
+    _fill_prices[order_id] = avg_price
+    _fill_event(order_id).set()
+
+
+async def listen_user_stream(api_key, api_secret, api_passphrase):
+    """Un listener WS per cheie API: rutează execuțiile BUY către Event-urile ordinelor."""
+    def on_status(connected):
+        if connected:
+            _streams_connected.add(api_key)
+        else:
+            _streams_connected.discard(api_key)
+
     while True:
-        executed, avg_price = check_order_executed(client, order_id)
+        try:
+            async with aclosing(open_user_stream(api_key, api_secret, api_passphrase, on_status)) as stream:
+                async for fill in stream:
+                    order_id = fill["order_id"]
+                    if fill["side"].lower() != "buy" or fill["avg_price"] <= 0:
+                        continue
+                    if order_id in _fill_events:
+                        notify_fill(order_id, fill["avg_price"])
+                    else:
+                        # Fill sosit înainte ca run_bot să înceapă așteptarea → îl păstrăm (limitat)
+                        _unclaimed_fills[order_id] = fill["avg_price"]
+                        if len(_unclaimed_fills) > MAX_UNCLAIMED_FILLS:
+                            _unclaimed_fills.pop(next(iter(_unclaimed_fills)))
+        except Exception as e:
+            _streams_connected.discard(api_key)
+            logging.error(f"❌ User stream error: {e}")
+        await asyncio.sleep(30)
+
+
+async def poll_order_fill(client, order_id, check_delay, streaming=False):
+    """Fallback REST: verifică ordinul până la execuție, cu backoff exponențial."""
+    # Cu stream WS activ, REST-ul e doar plasă de siguranță → pornește direct de la check_delay
+    delay = check_delay if streaming else POLL_INITIAL_DELAY
+    while not _fill_event(order_id).is_set():
+        await asyncio.sleep(delay)
+        executed, avg_price = await asyncio.to_thread(check_order_executed, client, order_id)
         if executed:
+            notify_fill(order_id, avg_price)
+            return
+        delay = min(delay * 2, check_delay)
+
+# =====================================================
+# ⏱️ Așteaptă execuția MARKET cu timeout
+# =====================================================
+async def wait_market_execution(client, symbol, order_id, amount, check_delay, cycle_id, streaming=False):
+    meta = {"order_id": order_id, "cycle_id": cycle_id, "strategy": "BTS"}
+    event = _fill_event(order_id)
+    if order_id in _unclaimed_fills:
+        notify_fill(order_id, _unclaimed_fills.pop(order_id))
+    poller = asyncio.create_task(poll_order_fill(client, order_id, check_delay, streaming))
+    saved_pending = False
+    try:
+        try:
+            await asyncio.wait_for(event.wait(), timeout=FAST_FILL_SECONDS)
+        except asyncio.TimeoutError:
+            # Execuție lentă → salvăm BUY-ul ca pending, ca să-l poată prelua checker-ul
+            await asyncio.to_thread(safe_save_order, symbol, "BUY", 0, "pending", meta)
+            saved_pending = True
+            await asyncio.wait_for(event.wait(), timeout=MARKET_TIMEOUT_SECONDS - FAST_FILL_SECONDS)
+    except asyncio.TimeoutError:
+        logging.warning(f"[{symbol}] ⏰ Timeout MARKET BUY — ordin pending, skip cycle.")
+        return False, 0
+    finally:
+        poller.cancel()
+        _fill_events.pop(order_id, None)
+        avg_price = _fill_prices.pop(order_id, 0)
+
+    if saved_pending:
+        await asyncio.to_thread(
             supabase.table("orders").update(
                 {
                     "status": "executed",
                     "price": avg_price,
                     "filled_size": amount,
-                    "last_updated": datetime.now(timezone.utc).isoformat(),
+                    "last_updated": utcnow_iso(),
                 }
-            ).eq("order_id", order_id).execute()
-            logging.info(f"[{symbol}] ✅ BUY executat @ {avg_price}")
-            return True, avg_price
-
-        if time.time() - start_ts > MARKET_TIMEOUT_SECONDS:
-            logging.warning(f"[{symbol}] ⏰ Timeout MARKET BUY — ordin pending, skip cycle.")
-            return False, 0
-
-        time.sleep(check_delay)
+            ).eq("order_id", order_id).execute
+        )
+    else:
+        # Execuție rapidă → un singur INSERT, direct cu status executed
+        await asyncio.to_thread(
+            safe_save_order, symbol, "BUY", avg_price, "executed", {**meta, "filled_size": amount}
+        )
+    logging.info(f"[{symbol}] ✅ BUY executat @ {avg_price}")
+    return True, avg_price
 
 # =====================================================
 # 🔍 Verificare ordine vechi (ultimele 5)
 # =====================================================
-def update_order_status(order_id, new_status, avg_price=None, filled_size=None, cycle_id=None):
-    data = {
-        "status": new_status,
-        "last_updated": datetime.now(timezone.utc).isoformat(),
-    }
-    if avg_price is not None:
-        data["price"] = avg_price
-    if filled_size is not None:
-        data["filled_size"] = filled_size
+# Pool separat: fan-out-ul orar nu ocupă executorul implicit folosit de boti
+_checker_executor = ThreadPoolExecutor(max_workers=CHECKER_MAX_WORKERS, thread_name_prefix="bts-checker")
+
 
-    supabase.table("orders").update(data).eq("order_id", order_id).execute()
-    if new_status == "executed" and cycle_id:
-        update_execution_time_and_profit(cycle_id)
-    logging.info(f"🟢 Updated {order_id}: {new_status} ({avg_price})")
+async def _in_checker_pool(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_checker_executor, func, *args)
 
 
-def check_old_orders(client, symbol):
-    result = (
+async def check_old_orders(client, symbol):
+    result = await _in_checker_pool(
         supabase.table("orders")
         .select("*")
         .eq("symbol", symbol)
@@ -111,116 +200,162 @@ def check_old_orders(client, symbol):
         .in_("status", ["pending", "open"])
         .order("last_updated", desc=False)
         .limit(5)
-        .execute()
+        .execute
     )
 
-    orders = result.data or []
+    orders = [o for o in (result.data or []) if o.get("order_id")]
     if not orders:
         logging.info(f"[{symbol}] ✅ Nicio comandă veche de verificat.")
         return
 
-    for order in orders:
-        order_id = order.get("order_id")
-        cycle_id = order.get("cycle_id")
-        side = order.get("side")
-        if not order_id:
-            continue
+    results = await asyncio.gather(
+        *[_in_checker_pool(check_order_executed, client, o["order_id"]) for o in orders]
+    )
 
-        done, avg_price = check_order_executed(client, order_id)
+    now = utcnow_iso()
+    pending_ids = []
+    executed = []
+    for order, (done, avg_price) in zip(orders, results):
         if done:
-            update_order_status(order_id, "executed", avg_price, None, cycle_id)
-            logging.info(f"[{symbol}] ✅ Ordin {side} executat: {order_id}")
+            executed.append((order, avg_price))
+            logging.info(f"[{symbol}] ✅ Ordin {order.get('side')} executat: {order['order_id']}")
         else:
-            update_order_status(order_id, "pending")
-            logging.info(f"[{symbol}] ⏳ Ordin {side} încă în așteptare: {order_id}")
+            pending_ids.append(order["order_id"])
+            logging.info(f"[{symbol}] ⏳ Ordin {order.get('side')} încă în așteptare: {order['order_id']}")
+
+    # Ordinele încă deschise: un singur UPDATE. Filtrul pe status lasă neatinse
+    # rândurile marcate între timp ca executed (ex. de wait_market_execution).
+    if pending_ids:
+        await _in_checker_pool(
+            supabase.table("orders")
+            .update({"status": "pending", "last_updated": now})
+            .in_("order_id", pending_ids)
+            .in_("status", ["pending", "open"])
+            .execute
+        )
+
+    # Ordinele executate: doar status / price / last_updated, în paralel
+    await asyncio.gather(
+        *[
+            _in_checker_pool(
+                supabase.table("orders")
+                .update({"status": "executed", "price": avg_price, "last_updated": now})
+                .eq("order_id", order["order_id"])
+                .execute
+            )
+            for order, avg_price in executed
+        ]
+    )
+    logging.info(f"[{symbol}] 🟢 Updated {len(orders)} order(s)")
+
+    executed_cycles = [order["cycle_id"] for order, _ in executed if order.get("cycle_id")]
+    for cycle_id in dict.fromkeys(executed_cycles):
+        await _in_checker_pool(update_execution_time_and_profit, cycle_id)
 
 # =====================================================
 # 🕒 Checker periodic
 # =====================================================
-def run_order_checker():
+async def check_bot_orders(bot):
+    """Verifică un singur bot; o eroare aici nu oprește verificarea celorlalți."""
+    try:
+        client = get_client(bot["api_key"], bot["api_secret"], bot["api_passphrase"])
+        await check_old_orders(client, bot["symbol"])
+    except Exception as e:
+        logging.error(f"[{bot.get('symbol')}] ❌ Eroare la verificarea ordinelor: {e}")
+
+
+async def run_order_checker():
     while True:
         try:
-            bots = get_latest_settings()
+            bots = await asyncio.to_thread(get_latest_settings)
             bts_bots = [b for b in bots if str(b.get("strategy", "")).lower() == "buy_sell"]
 
             if not bts_bots:
                 logging.warning("⚠️ Niciun bot BTS activ în settings.")
-                time.sleep(3600)
+                await asyncio.sleep(3600)
                 continue
 
-            logging.info(f"\n🔍 Pornesc verificarea la {datetime.now(timezone.utc).isoformat()}...\n")
-            for bot in bts_bots:
-                symbol = bot["symbol"]
-                client = init_client(bot["api_key"], bot["api_secret"], bot["api_passphrase"])
-                check_old_orders(client, symbol)
+            logging.info(f"\n🔍 Pornesc verificarea la {utcnow_iso()}...\n")
+            # Toți botii verificați în paralel: durata = cel mai lent bot, nu suma
+            await asyncio.gather(*[check_bot_orders(b) for b in bts_bots])
 
             logging.info("✅ Verificarea BTS s-a terminat. Următoarea în 1 oră.\n")
-            time.sleep(3600)
+            await asyncio.sleep(3600)
 
         except Exception as e:
             logging.error(f"❌ Eroare în BTS order_checker: {e}")
-            time.sleep(60)
+            await asyncio.sleep(60)
 
 # =====================================================
 # 🤖 Bot principal BTS
 # =====================================================
-def run_bot(settings):
-    symbol = settings["symbol"]
-    amount = float(settings["amount"])
-    sell_bonus = float(settings["buy_discount"])
-    check_delay = int(settings["check_delay"])
-    cycle_delay = int(settings["cycle_delay"])
-    api_key = settings["api_key"]
-    api_secret = settings["api_secret"]
-    api_passphrase = settings["api_passphrase"]
+async def run_bot(settings, startup_delay=0):
+    symbol = settings.get("symbol")
+    try:
+        amount = float(settings["amount"])
+        sell_bonus = float(settings["buy_discount"])
+        check_delay = int(settings["check_delay"])
+        cycle_delay = int(settings["cycle_delay"])
+        api_key = settings["api_key"]
+        api_secret = settings["api_secret"]
+        api_passphrase = settings["api_passphrase"]
+    except Exception as e:
+        # Setări invalide → oprim doar acest bot, ceilalți continuă
+        logging.error(f"[{symbol}] ❌ Invalid settings, bot not started: {e}")
+        return
 
     if sell_bonus > 1:
         sell_bonus = sell_bonus / 100.0
 
+    # Fiecare bot își așteaptă rândul înainte de primul apel REST
+    await asyncio.sleep(startup_delay)
     logging.info(f"[{symbol}] ⚙️ BTS bot started | amount={amount}, sell+={sell_bonus*100:.2f}%, cycle={cycle_delay/3600}h")
 
     while True:
         try:
-            client = init_client(api_key, api_secret, api_passphrase)
+            client = get_client(api_key, api_secret, api_passphrase)
             cycle_id = str(uuid.uuid4())
             logging.info(f"[{symbol}] 🧠 New BTS cycle {cycle_id} started...")
 
             # 1️⃣ BUY MARKET
-            buy_id = market_buy(client, symbol, amount, "BTS")
+            buy_id = await asyncio.to_thread(market_buy, client, symbol, amount, "BTS")
             if not buy_id:
                 logging.warning(f"[{symbol}] ⚠️ Market BUY failed — skipping cycle.")
-                time.sleep(cycle_delay)
+                await asyncio.sleep(cycle_delay)
                 continue
 
-            safe_save_order(symbol, "BUY", 0, "pending", {"order_id": buy_id, "cycle_id": cycle_id, "strategy": "BTS"})
-            ok, avg_price = wait_market_execution(client, symbol, buy_id, amount, check_delay, cycle_id)
+            ok, avg_price = await wait_market_execution(
+                client, symbol, buy_id, amount, check_delay, cycle_id, streaming=api_key in _streams_connected
+            )
             if not ok or avg_price <= 0:
-                time.sleep(cycle_delay)
+                await asyncio.sleep(cycle_delay)
                 continue
 
             # 2️⃣ SELL LIMIT
             sell_price = adjust_price_to_tick(avg_price * (1 + sell_bonus))
-            sell_id = place_limit_sell(client, symbol, amount, sell_price, "BTS")
+            sell_id = await asyncio.to_thread(place_limit_sell, client, symbol, amount, sell_price, "BTS")
             if not sell_id:
                 logging.warning(f"[{symbol}] ⚠️ Limit SELL failed — skipping cycle.")
-                time.sleep(cycle_delay)
+                await asyncio.sleep(cycle_delay)
                 continue
 
-            safe_save_order(symbol, "SELL", sell_price, "open", {"order_id": sell_id, "cycle_id": cycle_id, "strategy": "BTS"})
+            await asyncio.to_thread(
+                safe_save_order, symbol, "SELL", sell_price, "open", {"order_id": sell_id, "cycle_id": cycle_id, "strategy": "BTS"}
+            )
             logging.info(f"[{symbol}] 🔴 SELL limit placed @ {sell_price} (+{sell_bonus*100:.2f}%)")
 
             # Așteaptă următorul ciclu
             logging.info(f"[{symbol}] ⏳ Cycle complete → waiting {cycle_delay/3600}h\n")
-            time.sleep(cycle_delay)
+            await asyncio.sleep(cycle_delay)
 
         except Exception as e:
             logging.error(f"[{symbol}] ❌ Error: {e}")
-            time.sleep(30)
+            await asyncio.sleep(30)
 
 # =====================================================
 # 🚀 Start doar pentru strategia BTS
 # =====================================================
-def start_bts_bot():
+async def start_bts_bot():
     bots = get_latest_settings()
     bts_bots = [b for b in bots if str(b.get("strategy", "")).lower() == "buy_sell"]
 
@@ -228,15 +363,35 @@ def start_bts_bot():
         logging.warning("⚠️ No BUY_SELL bots found in Supabase.")
         return
 
+    # Un singur stream WS de execuții per cheie API
+    for settings in bts_bots:
+        api_key = settings.get("api_key")
+        api_secret = settings.get("api_secret")
+        api_passphrase = settings.get("api_passphrase")
+        if not (api_key and api_secret and api_passphrase):
+            # Rândul incomplet e raportat de run_bot; aici doar nu pornim stream-ul
+            continue
+        if api_key not in _user_streams:
+            _user_streams[api_key] = asyncio.create_task(
+                listen_user_stream(api_key, api_secret, api_passphrase)
+            )
+
+    # Pornire eșalonată, dar toată în maxim STARTUP_SPREAD_SECONDS
+    stagger = min(10, STARTUP_SPREAD_SECONDS / len(bts_bots))
+    tasks = list(_user_streams.values())
     for i, settings in enumerate(bts_bots):
-        threading.Thread(target=run_bot, args=(settings,), daemon=True).start()
-        logging.info(f"🕒 Delay 10s înainte de următorul bot ({i+1}/{len(bts_bots)})...")
-        time.sleep(10)
+        tasks.append(asyncio.create_task(run_bot(settings, startup_delay=i * stagger)))
+    logging.info(f"🕒 {len(bts_bots)} bot(i) porniți, eșalonați la {stagger:.1f}s.")
 
-    threading.Thread(target=run_order_checker, daemon=True).start()
-    while True:
-        time.sleep(60)
+    tasks.append(asyncio.create_task(run_order_checker()))
+    # Un task căzut nu trebuie să oprească restul botilor
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for res in results:
+        if isinstance(res, Exception):
+            logging.error(f"❌ BTS task stopped: {res}")
 
 
 if __name__ == "__main__":
-    start_bts_bot()
+    setup_logging()
+    logging.info("🚀 BTS BOT (Buy-Then-Sell) started...\n")
+    asyncio.run(start_bts_bot())
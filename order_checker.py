@@ -1,29 +1,10 @@
 import time
-from datetime import datetime, timezone
-from exchange import init_client, check_order_executed
-from supabase_client import get_latest_settings, supabase, update_execution_time_and_profit
+from concurrent.futures import ThreadPoolExecutor
+from exchange import get_client, check_order_executed
+from supabase_client import get_latest_settings, supabase, update_execution_time_and_profit, utcnow_iso
 
 print("🕒 BTS Order Checker started... (runs every hour)\n")
 
-# =====================================================
-# 🧱 Actualizare status în Supabase
-# =====================================================
-def update_order_status(order_id, new_status, avg_price=None, symbol=None, cycle_id=None):
-    """Actualizează statusul unui ordin în Supabase"""
-    data = {
-        "status": new_status,
-        "last_updated": datetime.now(timezone.utc).isoformat()
-    }
-    if avg_price is not None:
-        data["price"] = avg_price
-
-    supabase.table("orders").update(data).eq("order_id", order_id).execute()
-    print(f"[{symbol}] 🟢 Updated {order_id} → {new_status} @ {avg_price}")
-
-    # Dacă ordinul e executat complet → actualizează profitul ciclului
-    if new_status == "executed" and cycle_id:
-        update_execution_time_and_profit(cycle_id)
-
 # =====================================================
 # 🔍 Verificare ordine vechi (ultimele 5)
 # =====================================================
@@ -40,25 +21,59 @@ def check_old_orders(client, symbol):
         .execute()
     )
 
-    orders = result.data or []
+    orders = [o for o in (result.data or []) if o.get("order_id")]
     if not orders:
         print(f"[{symbol}][BTS] ✅ Nicio comandă de verificat.")
         return
 
-    for order in orders:
-        order_id = order.get("order_id")
-        cycle_id = order.get("cycle_id")
-        side = order.get("side")
-        if not order_id:
-            continue
+    # Statusurile de pe exchange se cer în paralel, nu unul după altul
+    with ThreadPoolExecutor(max_workers=len(orders)) as ex:
+        results = list(ex.map(lambda o: check_order_executed(client, o["order_id"]), orders))
 
-        done, avg_price = check_order_executed(client, order_id)
+    now = utcnow_iso()
+    pending_ids = []
+    executed = []
+    for order, (done, avg_price) in zip(orders, results):
         if done:
-            update_order_status(order_id, "executed", avg_price, symbol, cycle_id)
-            print(f"[{symbol}][BTS] ✅ Ordin {side} executat: {order_id} | preț mediu: {avg_price}")
+            executed.append((order, avg_price))
+            print(f"[{symbol}][BTS] ✅ Ordin {order.get('side')} executat: {order['order_id']} | preț mediu: {avg_price}")
         else:
-            update_order_status(order_id, "pending", symbol=symbol)
-            print(f"[{symbol}][BTS] ⏳ Ordin {side} încă în așteptare: {order_id}")
+            pending_ids.append(order["order_id"])
+            print(f"[{symbol}][BTS] ⏳ Ordin {order.get('side')} încă în așteptare: {order['order_id']}")
+
+    # Ordinele încă deschise: un singur UPDATE, fără să atingă rândurile executate între timp
+    if pending_ids:
+        (
+            supabase.table("orders")
+            .update({"status": "pending", "last_updated": now})
+            .in_("order_id", pending_ids)
+            .in_("status", ["pending", "open"])
+            .execute()
+        )
+
+    # Ordinele executate: doar status / price / last_updated
+    for order, avg_price in executed:
+        (
+            supabase.table("orders")
+            .update({"status": "executed", "price": avg_price, "last_updated": now})
+            .eq("order_id", order["order_id"])
+            .execute()
+        )
+    print(f"[{symbol}][BTS] 🟢 Updated {len(orders)} order(s)")
+
+    executed_cycles = [order["cycle_id"] for order, _ in executed if order.get("cycle_id")]
+
+    # Dacă ordinul e executat complet → actualizează profitul ciclului
+    for cycle_id in dict.fromkeys(executed_cycles):
+        update_execution_time_and_profit(cycle_id)
+
+def check_bot(bot):
+    """Verifică ordinele vechi pentru un singur bot BTS; o eroare nu oprește ceilalți boti"""
+    try:
+        client = get_client(bot["api_key"], bot["api_secret"], bot["api_passphrase"])
+        check_old_orders(client, bot["symbol"])
+    except Exception as e:
+        print(f"[{bot.get('symbol')}][BTS] ❌ Eroare la verificarea ordinelor: {e}")
 
 # =====================================================
 # 🔁 Bucla principală (rulează din oră în oră)
@@ -73,20 +88,15 @@ def run_checker():
                 time.sleep(3600)
                 continue
 
-            print(f"\n🔍 [BTS] Pornesc verificarea la {datetime.now(timezone.utc).isoformat()}...\n")
-
-            for bot in bots:
-                symbol = bot["symbol"]
-                strategy = bot.get("strategy", "").lower()
-                if strategy != "buy_sell":  # ✅ ignoră botii STB (sell_buy)
-                    continue
+            print(f"\n🔍 [BTS] Pornesc verificarea la {utcnow_iso()}...\n")
 
-                api_key = bot["api_key"]
-                api_secret = bot["api_secret"]
-                api_passphrase = bot["api_passphrase"]
+            # ✅ ignoră botii STB (sell_buy)
+            bts_bots = [b for b in bots if b.get("strategy", "").lower() == "buy_sell"]
 
-                client = init_client(api_key, api_secret, api_passphrase)
-                check_old_orders(client, symbol)
+            if bts_bots:
+                # Botii sunt verificați în paralel, nu unul după altul
+                with ThreadPoolExecutor(max_workers=min(16, len(bts_bots))) as ex:
+                    list(ex.map(check_bot, bts_bots))
 
             print("\n✅ [BTS] Verificarea s-a terminat. Următoarea în 1 oră.\n")
             time.sleep(3600)
@@ -0,0 +1,115 @@
+-- =====================================================
+-- 💰 compute_bts_profit(cycle) – profit per ciclu BUY → SELL (BTS)
+-- =====================================================
+-- Aceeași logică ca supabase_client.update_execution_time_and_profit,
+-- dar select → calcul → upsert într-un singur apel (supabase.rpc).
+-- Entry = primul BUY executat, Exit = ultimul SELL executat, profit în COIN.
+-- Parametrul are tipul coloanei orders.cycle_id, ca filtrul să poată folosi indexul.
+-- Returnează rândul scris în profit_per_cycle, sau nimic dacă ciclul e incomplet.
+drop function if exists compute_bts_profit;
+
+create function compute_bts_profit(cycle orders.cycle_id%type)
+returns setof profit_per_cycle
+language plpgsql
+as $$
+declare
+    first_buy  orders%rowtype;
+    last_sell  orders%rowtype;
+    buy_price  numeric;
+    sell_price numeric;
+    buy_qty    numeric;
+    sell_qty   numeric;
+    qty        numeric;
+    buy_time   timestamptz;
+    sell_time  timestamptz;
+    secs       numeric;
+    days       bigint;
+    rest       numeric;
+    micros     bigint;
+    exec_time  text;
+begin
+    select * into first_buy
+    from orders
+    where cycle_id = cycle
+      and strategy = 'BUY_SELL'
+      and status = 'executed'
+      and price > 0
+      and upper(side) = 'BUY'
+    order by created_at asc
+    limit 1;
+    if not found then
+        return;
+    end if;
+
+    select * into last_sell
+    from orders
+    where cycle_id = cycle
+      and strategy = 'BUY_SELL'
+      and status = 'executed'
+      and price > 0
+      and upper(side) = 'SELL'
+    order by created_at desc
+    limit 1;
+    if not found then
+        return;
+    end if;
+
+    buy_price  := first_buy.price::numeric;
+    sell_price := last_sell.price::numeric;
+    buy_qty    := coalesce(first_buy.filled_size, 0)::numeric;
+    sell_qty   := coalesce(last_sell.filled_size, 0)::numeric;
+
+    if buy_qty > 0 and sell_qty > 0 then
+        qty := least(buy_qty, sell_qty);
+    else
+        qty := greatest(buy_qty, sell_qty);
+    end if;
+
+    if qty <= 0 then
+        return;
+    end if;
+
+    buy_time  := coalesce(first_buy.last_updated, first_buy.created_at)::timestamptz;
+    sell_time := coalesce(last_sell.last_updated, last_sell.created_at)::timestamptz;
+
+    -- Același format ca str(timedelta) din Python: "1 day, 2:05:00.123456"
+    secs   := abs(extract(epoch from sell_time - buy_time))::numeric;
+    days   := floor(secs / 86400);
+    rest   := secs - days * 86400;
+    micros := round((rest - floor(rest)) * 1000000);
+    exec_time := case when days = 1 then '1 day, ' when days > 1 then days || ' days, ' else '' end
+        || floor(rest / 3600)::bigint || ':'
+        || lpad((floor(rest / 60)::bigint % 60)::text, 2, '0') || ':'
+        || lpad((floor(rest)::bigint % 60)::text, 2, '0')
+        || case when micros > 0 then '.' || lpad(micros::text, 6, '0') else '' end;
+
+    return query
+    insert into profit_per_cycle (
+        cycle_id, symbol, strategy, sell_price, buy_price,
+        profit_percent, profit_coin, profit_usdt, execution_time, last_updated
+    )
+    values (
+        first_buy.cycle_id,
+        first_buy.symbol,
+        'BUY_SELL',
+        sell_price,
+        buy_price,
+        round((sell_price - buy_price) / buy_price * 100, 2),
+        round((sell_price - buy_price) / buy_price * qty, 6),
+        0,  -- pentru BTS nu ne interesează USDT
+        exec_time,
+        now()
+    )
+    on conflict (cycle_id) do update set
+        symbol         = excluded.symbol,
+        strategy       = excluded.strategy,
+        sell_price     = excluded.sell_price,
+        buy_price      = excluded.buy_price,
+        profit_percent = excluded.profit_percent,
+        profit_coin    = excluded.profit_coin,
+        profit_usdt    = excluded.profit_usdt,
+        execution_time = excluded.execution_time,
+        last_updated   = excluded.last_updated
+    returning *;
+end;
+$$;
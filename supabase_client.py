@@ -1,7 +1,11 @@
 import os
+import sys
 import uuid
 from datetime import datetime, timezone
+import httpx
 from dotenv import load_dotenv
+from postgrest.exceptions import APIError
+from postgrest.utils import SyncClient
 from supabase import create_client
 
 # =====================================================
@@ -19,18 +23,50 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 # ⚙️ Create Supabase client
 # =====================================================
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+# Sesiune PostgREST partajată. Aceleași opțiuni ca postgrest.create_session (care are
+# deja HTTP/2); singura diferență e keep-alive-ul extins de la 5s la 5 minute, ca
+# apelurile la câteva minute distanță să reutilizeze conexiunea, fără un nou handshake TLS.
+_default_session = supabase.postgrest.session
+supabase.postgrest.session = SyncClient(
+    base_url=_default_session.base_url,
+    headers=_default_session.headers,
+    timeout=_default_session.timeout,
+    verify=True,
+    follow_redirects=True,
+    http2=True,
+    limits=httpx.Limits(keepalive_expiry=300),
+)
+_default_session.close()
 print(f"✅ Connected to Supabase project: {SUPABASE_URL.split('//')[1].split('.')[0]} (BTS)")
 
 
+def utcnow_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+# Python 3.11+ acceptă direct sufixul "Z" din timestamp-urile Supabase
+if sys.version_info >= (3, 11):
+    _parse_ts = datetime.fromisoformat
+else:
+    def _parse_ts(s):
+        return datetime.fromisoformat(s[:-1] + "+00:00" if s.endswith("Z") else s)
+
+
 # =====================================================
 # 📘 SETTINGS – doar boti BUY_SELL
 # =====================================================
 def get_latest_settings():
     """Returnează toate setările active BTS (BUY_SELL) din 'settings'."""
     try:
-        data = supabase.table("settings").select("*").eq("active", True).execute()
+        data = (
+            supabase.table("settings")
+            .select("*")
+            .eq("active", True)
+            .in_("strategy", ["BUY_SELL", "BTS", "buy_sell", "bts"])
+            .execute()
+        )
         bots = data.data or []
-        bots = [b for b in bots if str(b.get("strategy", "")).upper() in ("BUY_SELL", "BTS")]
         print(f"♻️ Reloaded {len(bots)} active BTS setting(s) from Supabase.")
         return bots
     except Exception as e:
@@ -43,13 +79,14 @@ def get_latest_settings():
 # =====================================================
 def save_order(symbol, side, price, status, extra=None):
     """Salvează un ordin în tabelul 'orders' pentru strategia BUY → SELL (BTS)."""
+    now = utcnow_iso()
     data = {
         "symbol": symbol,
         "side": side,
         "price": float(price),
         "status": status,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "last_updated": datetime.now(timezone.utc).isoformat(),
+        "created_at": now,
+        "last_updated": now,
         "strategy": "BUY_SELL",
     }
 
@@ -70,18 +107,52 @@ def save_order(symbol, side, price, status, extra=None):
 # =====================================================
 # 💰 Profit per cycle (BUY → SELL, profit în COIN)
 # =====================================================
+_profit_rpc_available = True  # devine False dacă compute_bts_profit nu există în DB
+
+
 def update_execution_time_and_profit(cycle_id: str):
     """
     Calculează durata și profitul efectiv pentru un ciclu BUY → SELL (BTS).
+    Rulează server-side prin funcția Postgres compute_bts_profit
+    (sql/compute_bts_profit.sql); dacă RPC-ul nu e disponibil, calculează local.
+    """
+    global _profit_rpc_available
+    if _profit_rpc_available:
+        try:
+            rows = supabase.rpc("compute_bts_profit", {"cycle": cycle_id}).execute().data or []
+            if rows:
+                row = rows[0]
+                print(
+                    f"💰 [BTS][{row['symbol']}] cycle {cycle_id} → {row['profit_percent']}% | COIN={row['profit_coin']}"
+                )
+            else:
+                print(f"[BTS] ⚠️ Skipping profit calc: incomplete cycle {cycle_id}")
+            return
+        except Exception as e:
+            if isinstance(e, APIError) and e.code == "PGRST202":
+                # Funcția nu e creată în Supabase → nu mai încercăm RPC-ul la fiecare ciclu
+                _profit_rpc_available = False
+                print("⚠️ [BTS] compute_bts_profit not deployed — using local profit calc from now on")
+            else:
+                print(f"⚠️ [BTS] compute_bts_profit RPC failed for {cycle_id}, fallback local: {e}")
+
+    _update_execution_time_and_profit_local(cycle_id)
+
+
+def _update_execution_time_and_profit_local(cycle_id: str):
+    """
+    Varianta locală: citește ordinele ciclului și face upsert în 'profit_per_cycle'.
     Profitul se calculează în COIN (nu în USDT).
     """
     try:
         result = (
             supabase.table("orders")
-            .select("side, price, created_at, last_updated, symbol, filled_size, strategy")
+            .select("side, price, created_at, last_updated, symbol, filled_size")
             .eq("cycle_id", cycle_id)
             .eq("strategy", "BUY_SELL")
             .eq("status", "executed")
+            .gt("price", 0)
+            .order("created_at", desc=False)
             .execute()
         )
         orders = result.data or []
@@ -89,34 +160,20 @@ def update_execution_time_and_profit(cycle_id: str):
             print(f"[BTS] ⚠️ Skipping profit calc: incomplete cycle {cycle_id}")
             return
 
-        # Separăm BUY / SELL și ignorăm ordinele fără preț
-        buys = [
-            o for o in orders
-            if str(o["side"]).upper() == "BUY" and float(o.get("price") or 0) > 0
-        ]
-        sells = [
-            o for o in orders
-            if str(o["side"]).upper() == "SELL" and float(o.get("price") or 0) > 0
-        ]
-
-        if not buys or not sells:
+        # Entry = primul BUY, Exit = ultimul SELL (ordinele vin sortate după created_at)
+        first_buy = next((o for o in orders if str(o["side"]).upper() == "BUY"), None)
+        last_sell = next((o for o in reversed(orders) if str(o["side"]).upper() == "SELL"), None)
+
+        if not first_buy or not last_sell:
             print(f"[BTS] ⚠️ Missing BUY/SELL prices for cycle {cycle_id}")
             return
 
-        # Entry = primul BUY, Exit = ultimul SELL
-        first_buy = sorted(buys, key=lambda o: o["created_at"])[0]
-        last_sell = sorted(sells, key=lambda o: o["created_at"])[-1]
-
         symbol = first_buy["symbol"]
         buy_price = float(first_buy["price"])
         sell_price = float(last_sell["price"])
 
-        buy_time = datetime.fromisoformat(
-            (first_buy.get("last_updated") or first_buy["created_at"]).replace("Z", "+00:00")
-        )
-        sell_time = datetime.fromisoformat(
-            (last_sell.get("last_updated") or last_sell["created_at"]).replace("Z", "+00:00")
-        )
+        buy_time = _parse_ts(first_buy.get("last_updated") or first_buy["created_at"])
+        sell_time = _parse_ts(last_sell.get("last_updated") or last_sell["created_at"])
 
         buy_qty = float(first_buy.get("filled_size") or 0)
         sell_qty = float(last_sell.get("filled_size") or 0)
@@ -149,7 +206,7 @@ def update_execution_time_and_profit(cycle_id: str):
                 "profit_coin": profit_coin,
                 "profit_usdt": profit_usdt,
                 "execution_time": str(execution_time),
-                "last_updated": datetime.now(timezone.utc).isoformat(),
+                "last_updated": utcnow_iso(),
             }
         ).execute()
 